@@ -1,9 +1,17 @@
 # app.py
 import os
+import time
+import asyncio
 import logging
-from typing import Optional, Type, Dict, Any
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional, Type, Deque, Dict, Any, Literal, Tuple
 
+import uvicorn
+from cachetools import TTLCache
 from fastapi import FastAPI, Body, Query
+from fastapi.responses import ORJSONResponse
+from lxml import etree
 from pydantic import BaseModel, Field
 from scrapli_netconf.driver.async_driver import AsyncNetconfDriver
 
@@ -17,9 +25,17 @@ app = FastAPI(
     title="NETCONF Tools",
     version="1.0.0",
     description="HTTP wrappers around scrapli_netconf for UTCP tool calls.",
+    default_response_class=ORJSONResponse,
 )
 
 # --------- Models ---------
+# Kept as Pydantic models: FastAPI builds /openapi.json from them, which is what UTCP
+# discovers the tools and their argument schemas from.
+Datastore = Literal["running", "candidate"]
+DefaultOperation = Literal["merge", "replace", "none"]
+TestOption = Literal["test-then-set", "set"]
+ErrorOption = Literal["stop-on-error", "continue-on-error"]
+
 class BaseConn(BaseModel):
     host: str = Field(..., description="NETCONF host/IP")
     port: int = Field(830, description="NETCONF port")
@@ -28,15 +44,16 @@ class BaseConn(BaseModel):
     password: Optional[str] = Field(default=None, description="Override env NETCONF_PASS")
 
 class GetConfigRequest(BaseConn):
-    source: str = Field("running", pattern="^(running|candidate)$")
+    source: Datastore = "running"
     filter_xml: Optional[str] = Field(default=None, description="Subtree filter XML")
+    parsed: bool = Field(False, description="Return <data> as JSON instead of the XML string")
 
 class EditConfigRequest(BaseConn):
-    target: str = Field("running", pattern="^(running|candidate)$")  # Arista: typically running
+    target: Datastore = "running"  # Arista: typically running
     config_xml: str = Field(..., description="Full <config>...</config> XML")
-    default_operation: str = Field("merge", pattern="^(merge|replace|none)$")
-    test_option: str = Field("set", pattern="^(test-then-set|set)$")
-    error_option: str = Field("stop-on-error", pattern="^(stop-on-error|continue-on-error)$")
+    default_operation: DefaultOperation = "merge"
+    test_option: TestOption = "set"
+    error_option: ErrorOption = "stop-on-error"
 
 class CommitRequest(BaseConn):
     confirmed: bool = False
@@ -58,6 +75,19 @@ def _mask(v: Optional[str]) -> str:
         return "*" * len(v)
     return v[:2] + "*" * (len(v) - 4) + v[-2:]
 
+# Pooled sessions sit idle between requests; keepalives detect dead peers so
+# isalive() fails fast. GCM ciphers first (AES-NI), CTR kept as a fallback.
+_ASYNCSSH_OPTIONS: Dict[str, Any] = {
+    "keepalive_interval": 30,
+    "keepalive_count_max": 3,
+    "encryption_algs": [
+        "aes128-gcm@openssh.com",
+        "aes256-gcm@openssh.com",
+        "aes128-ctr",
+        "aes256-ctr",
+    ],
+}
+
 def _device(req: BaseConn) -> Dict[str, Any]:
     user = req.username or _env("NETCONF_USER", "lab")
     pwd = req.password or _env("NETCONF_PASS", "")
@@ -73,21 +103,186 @@ def _device(req: BaseConn) -> Dict[str, Any]:
         "auth_strict_key": False,
         "transport": "asyncssh",
         "timeout_ops": req.timeout_ops,
+        "transport_options": {"asyncssh": _ASYNCSSH_OPTIONS},
     }
 
+_XML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
 def _escape(s: str) -> str:
-    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return s.translate(_XML_ESCAPE)
+
+# Keyed by (confirmed, has_comment)
+_COMMIT_RPC = {
+    (True, True): '<commit-configuration confirmed="true" confirm-timeout="{timeout}"><log>{comment}</log></commit-configuration>',
+    (True, False): '<commit-configuration confirmed="true" confirm-timeout="{timeout}"></commit-configuration>',
+    (False, True): "<commit-configuration><log>{comment}</log></commit-configuration>",
+    (False, False): "<commit-configuration></commit-configuration>",
+}
+
+def _xml_to_dict(el: etree._Element) -> Any:
+    """Compact JSON projection: local tag -> child dict or text, repeated tags -> list."""
+    out: Dict[str, Any] = {}
+    for child in el.iterchildren(tag=etree.Element):
+        key = etree.QName(child).localname
+        value = _xml_to_dict(child)
+        if key not in out:
+            out[key] = value
+        elif isinstance(out[key], list):
+            out[key].append(value)
+        else:
+            out[key] = [out[key], value]
+    if out:
+        return out
+    text = (el.text or "").strip()
+    return text or None
+
+def _config_data(reply: etree._Element) -> Any:
+    # scrapli_netconf already parsed the reply with lxml; walk that tree instead of re-parsing
+    data = reply.xpath("./*[local-name()='data']")
+    return _xml_to_dict(data[0] if data else reply)
 
 def _merge_to_model(model_cls: Type[BaseModel], body: Optional[BaseModel], **overrides) -> BaseModel:
     """Allow JSON body or query params; query params override body."""
-    data: Dict[str, Any] = body.dict() if body is not None else {}
-    for k, v in overrides.items():
-        if v is not None:
-            data[k] = v
-    return model_cls(**data)
-  
+    set_overrides = {k: v for k, v in overrides.items() if v is not None}
+    if body is None:
+        # Query-only input may be missing required fields: validate once.
+        return model_cls.model_validate(set_overrides)
+    if not set_overrides:
+        # Plain JSON body, already validated by FastAPI.
+        return body
+    # Body and query params were both validated by FastAPI; copy the body's field dict
+    # and apply only the overrides, without dumping or re-validating.
+    return body.model_copy(update=set_overrides)
+
+# --------- Connection pool ---------
+class NetconfPool:
+    """Idle NETCONF sessions kept per device so requests skip the SSH + hello exchange."""
+
+    def __init__(self, max_connections: int = 4, max_idle: float = 60.0):
+        self.max_connections = max_connections
+        self.max_idle = max_idle
+        # Idle sessions per key as (driver, last_used), oldest on the left
+        self._pools: Dict[Tuple[str, int, str, str], Deque[Tuple[AsyncNetconfDriver, float]]] = {}
+        self._limits: Dict[Tuple[str, int, str, str], asyncio.Semaphore] = {}
+
+    @staticmethod
+    def _key(dev: Dict[str, Any]) -> Tuple[str, int, str, str]:
+        # Password is part of the key so a session is never handed to different credentials.
+        return (dev["host"], dev["port"], dev["auth_username"], dev["auth_password"])
+
+    @asynccontextmanager
+    async def checkout(self, dev: Dict[str, Any], reuse: bool = True):
+        """
+        Yield a connected driver. With reuse=False the session is closed afterwards, for
+        calls whose side effects on the session (locks, open configuration) aren't known.
+        """
+        await self._evict_idle()
+        key = self._key(dev)
+        idle = self._pools.setdefault(key, deque())
+        limit = self._limits.setdefault(key, asyncio.Semaphore(self.max_connections))
+        async with limit:
+            conn = None
+            while idle:
+                # Most recently used first, so older sessions age out
+                candidate, _ = idle.pop()
+                if candidate.isalive():
+                    conn = candidate
+                    break
+                await self._close(candidate)
+            if conn is None:
+                conn = AsyncNetconfDriver(**dev)
+                await conn.open()
+            else:
+                log.info("NETCONF reuse host=%s port=%s", dev["host"], dev["port"])
+                conn.timeout_ops = dev["timeout_ops"]
+            try:
+                yield conn
+            except BaseException:
+                # Channel state is unknown after a failure; don't hand it to the next caller.
+                await self._close(conn)
+                raise
+            if reuse:
+                idle.append((conn, time.monotonic()))
+            else:
+                await self._close(conn)
+
+    async def _evict_idle(self) -> None:
+        cutoff = time.monotonic() - self.max_idle
+        for idle in self._pools.values():
+            while idle and idle[0][1] < cutoff:
+                conn, _ = idle.popleft()
+                await self._close(conn)
+
+    async def close_all(self) -> None:
+        for idle in self._pools.values():
+            while idle:
+                conn, _ = idle.popleft()
+                await self._close(conn)
+        self._pools.clear()
+        self._limits.clear()
+
+    @staticmethod
+    async def _close(conn: AsyncNetconfDriver) -> None:
+        try:
+            await conn.close()
+        except Exception as e:
+            log.debug("NETCONF close failed host=%s: %s", conn.host, e)
+
+pool = NetconfPool(
+    max_connections=int(_env("NETCONF_POOL_SIZE", "4")),
+    max_idle=float(_env("NETCONF_POOL_IDLE", "60")),
+)
+
+@app.on_event("shutdown")
+async def _close_pool() -> None:
+    await pool.close_all()
+
+# --------- get-config cache ---------
+# Opt-in short-lived cache for repeated identical get-config calls; concurrent misses share
+# one fetch. It is per process: writes only invalidate the worker that handled them, so it
+# is forced off when running more than one worker.
+_CACHE_TTL = float(_env("NETCONF_CACHE_TTL", "0"))
+_GET_CONFIG_CACHE: Optional[TTLCache] = TTLCache(maxsize=256, ttl=_CACHE_TTL) if _CACHE_TTL > 0 else None
+_GET_CONFIG_INFLIGHT: Dict[Tuple[Any, ...], asyncio.Task] = {}
+
+async def _get_config(req: GetConfigRequest, dev: Dict[str, Any]):
+    if _GET_CONFIG_CACHE is None:
+        return await _get_config_uncached(req, dev)
+    key = NetconfPool._key(dev) + (req.source, req.filter_xml)
+    rsp = _GET_CONFIG_CACHE.get(key)
+    if rsp is not None:
+        return rsp
+    task = _GET_CONFIG_INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_config(key, req, dev))
+        _GET_CONFIG_INFLIGHT[key] = task
+        task.add_done_callback(lambda t: _GET_CONFIG_INFLIGHT.pop(key) if _GET_CONFIG_INFLIGHT.get(key) is t else None)
+    # Shield so one cancelled caller doesn't cancel the fetch for the others.
+    return await asyncio.shield(task)
+
+async def _get_config_uncached(req: GetConfigRequest, dev: Dict[str, Any]):
+    async with pool.checkout(dev) as conn:
+        if req.filter_xml:
+            return await conn.get_config(source=req.source, filter_=req.filter_xml)
+        return await conn.get_config(source=req.source)
+
+async def _fetch_config(key: Tuple[Any, ...], req: GetConfigRequest, dev: Dict[str, Any]):
+    rsp = await _get_config_uncached(req, dev)
+    # Skip caching if a write invalidated this host while the fetch was running.
+    if not rsp.failed and _GET_CONFIG_INFLIGHT.get(key) is asyncio.current_task():
+        _GET_CONFIG_CACHE[key] = rsp
+    return rsp
+
+def _invalidate_config(host: str, port: int) -> None:
+    if _GET_CONFIG_CACHE is None:
+        return
+    for key in [k for k in _GET_CONFIG_CACHE if k[:2] == (host, port)]:
+        _GET_CONFIG_CACHE.pop(key, None)
+    for key in [k for k in _GET_CONFIG_INFLIGHT if k[:2] == (host, port)]:
+        _GET_CONFIG_INFLIGHT.pop(key, None)
+
 # --------- Endpoints ---------
-@app.post("/netconf/get-config", operation_id="netconf_get_config")
+@app.post("/netconf/get-config", operation_id="netconf_get_config", response_model=None, response_class=ORJSONResponse)
 async def netconf_get_config(
     body: Optional[GetConfigRequest] = Body(None),
     host: Optional[str] = Query(None),
@@ -95,23 +290,21 @@ async def netconf_get_config(
     timeout_ops: Optional[int] = Query(None),
     username: Optional[str] = Query(None),
     password: Optional[str] = Query(None),
-    source: Optional[str] = Query(None),
+    source: Optional[Datastore] = Query(None),
     filter_xml: Optional[str] = Query(None),
+    parsed: Optional[bool] = Query(None),
 ):
     req = _merge_to_model(
         GetConfigRequest, body,
         host=host, port=port, timeout_ops=timeout_ops, username=username, password=password,
-        source=source, filter_xml=filter_xml
+        source=source, filter_xml=filter_xml, parsed=parsed
     )
     dev = _device(req)
-    async with AsyncNetconfDriver(**dev) as conn:
-        if req.filter_xml:
-            rsp = await conn.get_config(source=req.source, filter_=req.filter_xml)
-        else:
-            rsp = await conn.get_config(source=req.source)
-        return {"ok": True, "source": req.source, "result": rsp.result}
+    rsp = await _get_config(req, dev)
+    result = _config_data(rsp.xml_result) if req.parsed else rsp.result
+    return ORJSONResponse({"ok": True, "source": req.source, "result": result})
 
-@app.post("/netconf/edit-config", operation_id="netconf_edit_config")
+@app.post("/netconf/edit-config", operation_id="netconf_edit_config", response_model=None, response_class=ORJSONResponse)
 async def netconf_edit_config(
     body: Optional[EditConfigRequest] = Body(None),
     host: Optional[str] = Query(None),
@@ -119,11 +312,11 @@ async def netconf_edit_config(
     timeout_ops: Optional[int] = Query(None),
     username: Optional[str] = Query(None),
     password: Optional[str] = Query(None),
-    target: Optional[str] = Query(None),
+    target: Optional[Datastore] = Query(None),
     config_xml: Optional[str] = Query(None),
-    default_operation: Optional[str] = Query(None),
-    test_option: Optional[str] = Query(None),
-    error_option: Optional[str] = Query(None),
+    default_operation: Optional[DefaultOperation] = Query(None),
+    test_option: Optional[TestOption] = Query(None),
+    error_option: Optional[ErrorOption] = Query(None),
 ):
     req = _merge_to_model(
         EditConfigRequest, body,
@@ -132,7 +325,7 @@ async def netconf_edit_config(
         test_option=test_option, error_option=error_option
     )
     dev = _device(req)
-    async with AsyncNetconfDriver(**dev) as conn:
+    async with pool.checkout(dev) as conn:
         rsp = await conn.edit_config(
             config=req.config_xml,
             target=req.target,
@@ -140,9 +333,10 @@ async def netconf_edit_config(
             test_option=req.test_option,
             error_option=req.error_option,
         )
-        return {"ok": True, "target": req.target, "result": rsp.result}
+        _invalidate_config(req.host, req.port)
+        return ORJSONResponse({"ok": True, "target": req.target, "result": rsp.result})
 
-@app.post("/netconf/commit", operation_id="netconf_commit")
+@app.post("/netconf/commit", operation_id="netconf_commit", response_model=None, response_class=ORJSONResponse)
 async def netconf_commit(
     body: Optional[CommitRequest] = Body(None),
     host: Optional[str] = Query(None),
@@ -160,22 +354,16 @@ async def netconf_commit(
         confirmed=confirmed, confirm_timeout=confirm_timeout, comment=comment
     )
     dev = _device(req)
-    async with AsyncNetconfDriver(**dev) as conn:
-        if req.confirmed:
-            rpc = f'<commit-configuration confirmed="true" confirm-timeout="{int(req.confirm_timeout)}">'
-            if req.comment:
-                rpc += f"<log>{_escape(req.comment)}</log>"
-            rpc += "</commit-configuration>"
-            rsp = await conn.rpc(rpc)
-        else:
-            rpc = "<commit-configuration>"
-            if req.comment:
-                rpc += f"<log>{_escape(req.comment)}</log>"
-            rpc += "</commit-configuration>"
-            rsp = await conn.rpc(rpc)
-        return {"ok": True, "result": rsp.result}
-
-@app.post("/netconf/rpc", operation_id="netconf_rpc")
+    async with pool.checkout(dev) as conn:
+        rpc = _COMMIT_RPC[(bool(req.confirmed), bool(req.comment))].format(
+            timeout=int(req.confirm_timeout),
+            comment=_escape(req.comment) if req.comment else "",
+        )
+        rsp = await conn.rpc(rpc)
+        _invalidate_config(req.host, req.port)
+        return ORJSONResponse({"ok": True, "result": rsp.result})
+
+@app.post("/netconf/rpc", operation_id="netconf_rpc", response_model=None, response_class=ORJSONResponse)
 async def netconf_rpc(
     body: Optional[RpcRequest] = Body(None),
     host: Optional[str] = Query(None),
@@ -191,6 +379,25 @@ async def netconf_rpc(
         rpc_xml=rpc_xml
     )
     dev = _device(req)
-    async with AsyncNetconfDriver(**dev) as conn:
+    # Raw RPCs may leave state on the session (<lock>, <open-configuration>, ...); don't pool it
+    async with pool.checkout(dev, reuse=False) as conn:
         rsp = await conn.rpc(req.rpc_xml)
-        return {"ok": True, "rpc": req.rpc_xml, "result": rsp.result}
+        # Raw RPCs may change config too
+        _invalidate_config(req.host, req.port)
+        return ORJSONResponse({"ok": True, "rpc": req.rpc_xml, "result": rsp.result})
+
+if __name__ == "__main__":
+    workers = int(_env("NETCONF_WORKERS", str(os.cpu_count() or 1)))
+    if workers > 1 and _CACHE_TTL > 0:
+        # Cache invalidation doesn't cross processes; a read on another worker could be stale.
+        log.warning("NETCONF_CACHE_TTL ignored with %s workers; get-config cache disabled", workers)
+        os.environ["NETCONF_CACHE_TTL"] = "0"
+    # uvloop + httptools; each worker keeps its own connection pool
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
+    )
@@ -1,12 +1,18 @@
 import asyncio
-import json
+import logging
 import os
 import re
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 
 import gradio as gr
+import httpx
+import orjson
+import uvloop
 from dotenv import load_dotenv
+from pydantic import TypeAdapter
 from utcp.client.utcp_client import UtcpClient
 from utcp.client.utcp_client_config import UtcpClientConfig, UtcpDotEnv
 from utcp.shared.tool import Tool
@@ -16,6 +22,8 @@ import openai
 # -------------------------
 # Config / Init
 # -------------------------
+log = logging.getLogger("utcp_client")
+
 ROOT = Path(__file__).resolve().parent
 PROVIDERS = str(ROOT / "providers.json")
 ENV_FILE = str(ROOT / ".env")  # optional but recommended
@@ -27,11 +35,24 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY not set. Put it in .env or export it.")
 
-oai = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+# One pooled HTTP/2 client: both completions in a turn reuse the same TLS connection
+oai = openai.AsyncOpenAI(
+    api_key=OPENAI_API_KEY,
+    http_client=openai.DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60.0),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    ),
+)
 
 # Created once at startup
 _utcp_client: Optional[UtcpClient] = None
 
+# (fetched_at, tools, tool-call system message); tool schemas rarely change between turns
+_TOOLS_TTL = 60.0
+_tools_cache: Optional[Tuple[float, List[Tool], Dict[str, str]]] = None
+_tools_refresh: Optional[asyncio.Task] = None
+
 
 # -------------------------
 # UTCP helpers
@@ -49,13 +70,50 @@ async def init_utcp() -> UtcpClient:
     return _utcp_client
 
 
+# Built once; reusing it avoids rebuilding the list serializer per call
+_TOOL_LIST_ADAPTER = TypeAdapter(List[Tool])
+
+
 async def discover_tools(client: UtcpClient, query: str = "netconf", limit: int = 50) -> List[Tool]:
     return await client.search_tools(query, limit=limit)
 
 
 def tools_to_json_for_prompt(tools: List[Tool]) -> str:
     """Serialize tools as JSON so the LLM can see exact names + arg schemas."""
-    return json.dumps([t.model_dump() for t in tools], indent=2)
+    return _TOOL_LIST_ADAPTER.dump_json(tools, indent=2).decode()
+
+
+async def refresh_tools(client: UtcpClient) -> Tuple[float, List[Tool], Dict[str, str]]:
+    global _tools_cache
+    tools = await discover_tools(client, "netconf", limit=50)
+    system_msg = build_tool_call_system(tools_to_json_for_prompt(tools))
+    _tools_cache = (time.monotonic(), tools, system_msg)
+    return _tools_cache
+
+
+def _log_refresh_failure(task: asyncio.Task) -> None:
+    # Background refreshes are never awaited when a stale cache is served; surface failures here.
+    if not task.cancelled() and task.exception() is not None:
+        log.warning("UTCP tool discovery failed; keeping previous tools: %r", task.exception())
+
+
+async def get_tools(client: UtcpClient) -> Tuple[List[Tool], Dict[str, str]]:
+    """
+    Discovered tools plus the tool-call system message built from them,
+    refreshed at most every _TOOLS_TTL seconds.
+    """
+    global _tools_refresh
+    if _tools_cache and time.monotonic() - _tools_cache[0] < _TOOLS_TTL:
+        return _tools_cache[1], _tools_cache[2]
+
+    if _tools_refresh is None or _tools_refresh.done():
+        _tools_refresh = asyncio.create_task(refresh_tools(client))
+        _tools_refresh.add_done_callback(_log_refresh_failure)
+    if _tools_cache:
+        # Stale: answer with the previous tools while discovery runs in the background
+        return _tools_cache[1], _tools_cache[2]
+    _, tools, system_msg = await _tools_refresh
+    return tools, system_msg
 
 
 # -------------------------
@@ -74,42 +132,55 @@ FINAL_ANSWER_SYSTEM = (
     "If the tool failed, explain the error and suggest the next troubleshooting step.\n"
 )
 
-def build_tool_call_messages(history, tools_json: str):
-    content = f"{TOOL_CALL_SYSTEM}{tools_json}\n"
-    msgs = [{"role": "system", "content": content}]
-    for role, content in history:
-        msgs.append({"role": role, "content": content})
-    return msgs
+# History is kept in OpenAI message format so it can be passed through as-is.
+Message = Dict[str, str]
 
+def build_tool_call_system(tools_json: str) -> Message:
+    return {"role": "system", "content": f"{TOOL_CALL_SYSTEM}{tools_json}\n"}
 
-def build_final_messages(history: List[Tuple[str, str]], tool_output: str) -> List[Dict[str, str]]:
-    msgs = [{"role": "system", "content": FINAL_ANSWER_SYSTEM}]
-    for role, content in history:
-        msgs.append({"role": role, "content": content})
-    msgs.append({"role": "user", "content": f"Tool output:\n{tool_output}\n\nPlease answer the original request using this output."})
-    return msgs
 
+def build_tool_call_messages(history: List[Message], system_msg: Message, user_msg: Message) -> List[Message]:
+    return [system_msg, *history, user_msg]
 
-async def chat_complete(messages: List[Dict[str, str]]) -> str:
-    resp = await oai.chat.completions.create(
+
+def build_final_messages(msgs_tool: List[Message], tool_msg: Message) -> List[Message]:
+    """
+    Extend the tool-call messages in place, swapping in the final-answer system prompt.
+    The tool output is appended with tool_output_message() once it arrives.
+    """
+    msgs_tool[0] = {"role": "system", "content": FINAL_ANSWER_SYSTEM}
+    msgs_tool.append(tool_msg)
+    return msgs_tool
+
+
+def tool_output_message(tool_output: str) -> Message:
+    return {"role": "user", "content": f"Tool output:\n{tool_output}\n\nPlease answer the original request using this output."}
+
+
+async def chat_stream(messages: List[Message]) -> AsyncIterator[str]:
+    """Yield content deltas as the model produces them."""
+    stream = await oai.chat.completions.create(
         model=OPENAI_MODEL,
         messages=messages,
         temperature=0.2,
+        stream=True,
     )
-    return resp.choices[0].message.content or ""
+    async with stream:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
 
 TOOL_JSON_RE = re.compile(r"```json\s*({.*?})\s*```", re.DOTALL)
+# fallback: first {...} block
+BARE_JSON_RE = re.compile(r"(\{[\s\S]*\})")
 
 def extract_tool_json(s: str) -> Optional[Dict[str, Any]]:
-    m = TOOL_JSON_RE.search(s)
-    if not m:
-        # fallback: first {...} block
-        m = re.search(r"(\{[\s\S]*\})", s)
+    m = TOOL_JSON_RE.search(s) or BARE_JSON_RE.search(s)
     if not m:
         return None
     try:
-        return json.loads(m.group(1))
+        return orjson.loads(m.group(1))
     except Exception:
         return None
 
@@ -117,44 +188,73 @@ def extract_tool_json(s: str) -> Optional[Dict[str, Any]]:
 # -------------------------
 # Orchestration per user query
 # -------------------------
-async def handle_user_query(user_text: str, state_history: List[Tuple[str, str]]) -> Tuple[str, str, str, List[Tuple[str, str]]]:
+async def request_tool_call(client: UtcpClient, messages: List[Message]) -> Tuple[str, Optional[Dict[str, Any]], Optional[asyncio.Task]]:
+    """
+    Stream the tool-call reply and start the tool as soon as a complete tool JSON arrives.
+    Returns (assistant_raw, tool_obj, tool_task); tool_obj/tool_task are None if no tool was chosen.
+    """
+    parts: List[str] = []
+    deltas = chat_stream(messages)
+    try:
+        async for delta in deltas:
+            parts.append(delta)
+            if "}" not in delta:
+                continue
+            tool_obj = extract_tool_json("".join(parts))
+            if tool_obj and "tool_name" in tool_obj and "arguments" in tool_obj:
+                # Don't wait for the trailing tokens; the tool call is already complete
+                tool_task = asyncio.create_task(client.call_tool(tool_obj["tool_name"], tool_obj["arguments"]))
+                return "".join(parts), tool_obj, tool_task
+    finally:
+        await deltas.aclose()
+    return "".join(parts), None, None
+
+
+async def handle_user_query(user_text: str, state_history: List[Message]) -> AsyncIterator[Tuple[str, str, str, List[Message]]]:
     """
-    Returns (assistant_tool_json, tool_result_text, final_answer, updated_history)
+    Yields (assistant_tool_json, tool_result_text, final_answer_so_far, updated_history)
+    as the turn progresses; the last item carries the complete answer and history.
     """
     client = await init_utcp()
-    tools = await discover_tools(client, "netconf", limit=50)
-    tools_json = tools_to_json_for_prompt(tools)
+    _, system_msg = await get_tools(client)
 
     # Step 1: Ask model for a tool call (JSON only)
-    history = state_history.copy()
-    history.append(("user", user_text))
-    msgs_tool = build_tool_call_messages(history, tools_json)
-    assistant_raw = await chat_complete(msgs_tool)
-    tool_obj = extract_tool_json(assistant_raw)
+    user_msg = {"role": "user", "content": user_text}
+    msgs_tool = build_tool_call_messages(state_history, system_msg, user_msg)
+    assistant_raw, tool_obj, tool_task = await request_tool_call(client, msgs_tool)
 
-    if not tool_obj or "tool_name" not in tool_obj or "arguments" not in tool_obj:
+    if tool_obj is None:
         # No tool chosen; just present the model's text
-        history.append(("assistant", assistant_raw))
-        return (assistant_raw, "(no tool called)", assistant_raw, history)
+        history = state_history + [user_msg, {"role": "assistant", "content": assistant_raw}]
+        yield (assistant_raw, "(no tool called)", assistant_raw, history)
+        return
 
-    # Step 2: Execute the tool
+    # Step 2: Execute the tool (already running since the JSON completed)
     tool_name = tool_obj["tool_name"]
     arguments = tool_obj["arguments"]
+    tool_obj_text = orjson.dumps(tool_obj, option=orjson.OPT_INDENT_2).decode()
+    yield (tool_obj_text, "(running tool...)", "", state_history)
+
+    # The assistant tool JSON goes into both the final prompt and the visible history;
+    # build the final prompt while the tool is still in flight
+    tool_msg = {"role": "assistant", "content": tool_obj_text}
+    msgs_final = build_final_messages(msgs_tool, tool_msg)
+
     try:
-        tool_result = await client.call_tool(tool_name, arguments)
-        tool_result_text = json.dumps(tool_result, indent=2)
+        tool_result = await tool_task
+        tool_result_text = orjson.dumps(tool_result, option=orjson.OPT_INDENT_2).decode()
     except Exception as e:
         tool_result_text = f"Tool call error for {tool_name} with args {arguments}:\n{str(e)}"
 
-    # Add both the initial assistant tool JSON and the result to the visible history
-    history.append(("assistant", json.dumps(tool_obj, indent=2)))
+    # Step 3: Stream the final answer using tool output
+    msgs_final.append(tool_output_message(tool_result_text))
+    final_answer = ""
+    async for delta in chat_stream(msgs_final):
+        final_answer += delta
+        yield (tool_obj_text, tool_result_text, final_answer, state_history)
 
-    # Step 3: Ask model for final answer using tool output
-    msgs_final = build_final_messages(history, tool_result_text)
-    final_answer = await chat_complete(msgs_final)
-    history.append(("assistant", final_answer))
-
-    return (json.dumps(tool_obj, indent=2), tool_result_text, final_answer, history)
+    history = state_history + [user_msg, tool_msg, {"role": "assistant", "content": final_answer}]
+    yield (tool_obj_text, tool_result_text, final_answer, history)
 
 
 # -------------------------
@@ -176,26 +276,25 @@ with gr.Blocks(title="UTCP + OpenAI + NETCONF") as demo:
 
     state = gr.State(value=[])
 
-    async def on_submit(user_text, st):
-        assistant_tool_json, tool_result_text, final_answer, new_state = await handle_user_query(user_text, st or [])
-        # Build a compact chat transcript
-        chat_pairs = []
-        tmp_state = st.copy() if st else []
-        tmp_state.append(("user", user_text))
-        # Show assistant tool JSON line in chat for transparency
-        tmp_state.append(("assistant", f"Proposed tool call:\n```json\n{assistant_tool_json}\n```"))
-        tmp_state.append(("assistant", final_answer))
-        # Convert to Chatbot format
-        for i in range(0, len(tmp_state), 2):
-            user_msg = tmp_state[i][1] if i < len(tmp_state) and tmp_state[i][0] == "user" else ""
-            asst_msg = tmp_state[i+1][1] if i+1 < len(tmp_state) and tmp_state[i+1][0] == "assistant" else ""
-            if user_msg or asst_msg:
-                chat_pairs.append([user_msg, asst_msg])
-        return chat_pairs, assistant_tool_json, tool_result_text, final_answer, new_state
+    async def on_submit(user_text, st, transcript):
+        # Append this turn's pair and fill in the answer as it streams
+        transcript = transcript or []
+        transcript.append([user_text, ""])
+        try:
+            async for assistant_tool_json, tool_result_text, final_answer, new_state in handle_user_query(user_text, st or []):
+                transcript[-1][1] = final_answer
+                # State is only committed once the turn completes
+                yield transcript, assistant_tool_json, tool_result_text, final_answer, gr.skip()
+        except Exception as e:
+            # Drop the pending pair so the transcript matches the unchanged state
+            transcript.pop()
+            yield transcript, gr.skip(), gr.skip(), gr.skip(), gr.skip()
+            raise gr.Error(f"Request failed: {e}")
+        yield transcript, assistant_tool_json, tool_result_text, final_answer, new_state
 
     submit.click(
         on_submit,
-        inputs=[user_box, state],
+        inputs=[user_box, state, chat],
         outputs=[chat, tool_json_out, tool_result_out, final_answer_out, state],
     )
 
@@ -204,7 +303,16 @@ with gr.Blocks(title="UTCP + OpenAI + NETCONF") as demo:
 
     clear.click(on_clear, outputs=[chat, tool_json_out, tool_result_out, final_answer_out, state])
 
+
+@asynccontextmanager
+async def gradio_lifespan(_app):
+    yield
+    # Runs on Gradio's server loop, which owns the pooled OpenAI connections
+    await oai.close()
+
+
 if __name__ == "__main__":
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     # Make sure the UTCP client is ready before launching Gradio
     asyncio.run(init_utcp())
-    demo.launch(server_name="0.0.0.0", server_port=7860)
+    demo.launch(server_name="0.0.0.0", server_port=7860, app_kwargs={"lifespan": gradio_lifespan})